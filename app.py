@@ -1,14 +1,73 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from models import Employee, ShiftRequest, Day, TimeBlock, RoleConstraint
-from solver import solve_schedule
-import uuid
+from models import Employee, ShiftRequest, Day, TimeBlock, RoleConstraint, ScheduleOutput, DAY_VALUES, BLOCK_VALUES, DAY_INDEX, BLOCK_INDEX
+from solver import solve_schedule, generate_whatsapp_export
 import json
+import io
 
 # --- CONFIG ---
 st.set_page_config(page_title="ShiftHero V1.6", layout="wide")
 
+# --- SOLVER CACHE ---
+# Identical inputs (e.g. clicking Generate twice) skip the CP-SAT rebuild/solve.
+# Args are JSON strings so the cache key is cheap to hash; return is a plain dict.
+# _hint (warm start) is underscore-prefixed so Streamlit leaves it out of the cache key.
+# Only OPTIMAL results are cached: st.cache_data stores nothing when the call raises, so
+# a time-limited or failed solve is handed back via _NotOptimal and retried next click.
+class _NotOptimal(Exception):
+    def __init__(self, result: dict):
+        super().__init__("solve did not reach optimality")
+        self.result = result
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _solve_optimal_cached(emp_json: str, dem_json: str, rc_json: str, _hint: frozenset = frozenset()) -> dict:
+    employees = [Employee(**e) for e in json.loads(emp_json)]
+    demands = [ShiftRequest(**r) for r in json.loads(dem_json)]
+    role_constraints = [RoleConstraint(**rc) for rc in json.loads(rc_json)]
+    result = solve_schedule(employees, demands, role_constraints, hint=_hint)
+    if not result.is_optimal:
+        raise _NotOptimal(result.model_dump())
+    return result.model_dump()
+
+def _solve_cached(emp_json: str, dem_json: str, rc_json: str, _hint: frozenset = frozenset()) -> dict:
+    try:
+        return _solve_optimal_cached(emp_json, dem_json, rc_json, _hint=_hint)
+    except _NotOptimal as e:
+        return e.result
+
+def _warm_start_hint(prev) -> frozenset:
+    if prev is None:
+        return frozenset()
+    return frozenset(
+        (emp_id, a["day"], a["block"]) for a in prev.assignments for emp_id in a.get("staff_ids", [])
+    )
+
+def _to_json(items) -> str:
+    return json.dumps([i.model_dump(mode="json") for i in items], sort_keys=True)
+
+# Hashable (columns, rows) snapshot of a DataFrame: O(rows) to build and cheap to hash
+def _df_key(df: pd.DataFrame) -> tuple:
+    return tuple(df.columns), tuple(df.itertuples(index=False, name=None))
+
+def _records(key: tuple) -> list:
+    cols, rows = key
+    return [dict(zip(cols, row)) for row in rows]
+
+# Download payloads; only re-serialized when their content actually changes
+@st.cache_data(max_entries=8, show_spinner=False)
+def _serialize_team_config(staff: tuple, rules: tuple, unavailable: tuple) -> str:
+    return json.dumps({
+        "staff": _records(staff),
+        "role_rules": _records(rules),
+        "unavailable": [dict(u) for u in unavailable]
+    }, indent=2)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _schedule_csv(schedule: tuple) -> bytes:
+    cols, rows = schedule
+    return pd.DataFrame(list(rows), columns=list(cols)).to_csv(index=False).encode('utf-8')
+
 # --- STATE MANAGEMENT ---
 if 'staff_data' not in st.session_state:
     st.session_state.staff_data = pd.DataFrame([
@@ -38,9 +97,9 @@ with st.sidebar:
     # NEW: Help / Onboarding
     with st.expander("❓ How to use"):
         st.markdown("""
-        1. **Edit Staff:** Update names and roles in *Step 1*.
+        1. **Edit Staff:** Update names and roles in *Step 1*, then click *Save Staff*.
         2. **Set Rules:** Add "Availability Exceptions" if someone is off.
-        3. **Input Demand:** Set how many staff you need in *Step 2*.
+        3. **Input Demand:** Set how many staff you need in *Step 2*, then click *Save Demand*.
         4. **Generate:** Click the rocket button!
         5. **Refine:** Edit the result table directly, then download or copy to WhatsApp.
         """)
@@ -53,12 +112,11 @@ with st.sidebar:
     
     # 1. Download Config
     # We bundle Staff, Rules, and Unavailability into one JSON
-    current_state = {
-        "staff": st.session_state.staff_data.to_dict(orient="records"),
-        "role_rules": st.session_state.role_rules.to_dict(orient="records"),
-        "unavailable": st.session_state.unavailable_constraints
-    }
-    json_str = json.dumps(current_state, indent=2)
+    json_str = _serialize_team_config(
+        _df_key(st.session_state.staff_data),
+        _df_key(st.session_state.role_rules),
+        tuple(tuple(u.items()) for u in st.session_state.unavailable_constraints)
+    )
     
     st.download_button(
         label="📥 Download Team Config",
@@ -101,11 +159,14 @@ with st.expander("1. Staff & Constraints", expanded=True):
     tab1, tab2, tab3 = st.tabs(["Staff List", "Availability Exceptions", "Paste CSV"])
     
     with tab1:
-        st.session_state.staff_data = st.data_editor(
-            st.session_state.staff_data, 
-            num_rows="dynamic",
-            use_container_width=True
-        )
+        # Form batches grid edits into a single rerun on submit
+        with st.form("staff_form"):
+            st.session_state.staff_data = st.data_editor(
+                st.session_state.staff_data, 
+                num_rows="dynamic",
+                use_container_width=True
+            )
+            st.form_submit_button("💾 Save Staff")
         
     with tab2:
         c1, c2, c3, c4 = st.columns([2, 2, 2, 1])
@@ -114,9 +175,9 @@ with st.expander("1. Staff & Constraints", expanded=True):
             staff_names = st.session_state.staff_data['name'].unique() if not st.session_state.staff_data.empty else []
             sel_name = st.selectbox("Staff", staff_names) if len(staff_names) > 0 else st.text_input("Staff Name")
         with c2:
-            sel_day = st.selectbox("Day", [d.value for d in Day])
+            sel_day = st.selectbox("Day", DAY_VALUES)
         with c3:
-            sel_block = st.selectbox("Block", [b.value for b in TimeBlock])
+            sel_block = st.selectbox("Block", BLOCK_VALUES)
         with c4:
             st.write("") 
             if st.button("🚫 Block"):
@@ -137,65 +198,82 @@ with st.expander("1. Staff & Constraints", expanded=True):
         txt = st.text_area("Paste: Name, Role, MaxHours")
         if st.button("Parse CSV"):
             try:
-                lines = [l.split(',') for l in txt.split('\n') if l.strip()]
-                parsed = [{"name": l[0].strip(), "role": l[1].strip(), "max_hours": int(l[2].strip())} for l in lines if len(l) > 2]
-                if parsed:
-                    st.session_state.staff_data = pd.DataFrame(parsed)
+                # C parser handles quoting/whitespace. Everything is read as plain text (no NA
+                # inference) so empty roles or names like "None" survive; short rows have an
+                # empty max_hours and are skipped, and int() keeps bad hours on the error path.
+                parsed = pd.read_csv(
+                    io.StringIO(txt), header=None, names=["name", "role", "max_hours"],
+                    usecols=[0, 1, 2], dtype=str, keep_default_na=False, skipinitialspace=True
+                ) if txt.strip() else pd.DataFrame()
+                if not parsed.empty:
+                    parsed = parsed.apply(lambda col: col.str.strip())
+                    parsed = parsed[parsed["max_hours"] != ""]
+                if not parsed.empty:
+                    parsed["max_hours"] = [int(h) for h in parsed["max_hours"]]
+                    st.session_state.staff_data = parsed.reset_index(drop=True)
                     st.rerun()
             except Exception as e:
                 st.error(f"Parse error: {e}")
 
 # STEP 2: DEMAND
 with st.expander("2. Demand (Staff Count)", expanded=True):
-    st.session_state.demand_data = st.data_editor(
-        st.session_state.demand_data, 
-        hide_index=True,
-        use_container_width=True
-    )
+    with st.form("demand_form"):
+        st.session_state.demand_data = st.data_editor(
+            st.session_state.demand_data, 
+            hide_index=True,
+            use_container_width=True
+        )
+        st.form_submit_button("💾 Save Demand")
 
 # STEP 3: GENERATE
 if st.button("🚀 Generate Schedule", type="primary"):
     with st.spinner("Optimizing schedule..."):
         
         employees = []
-        for _, row in st.session_state.staff_data.iterrows():
+        for i, row in enumerate(st.session_state.staff_data.itertuples(index=False)):
             my_blocks = [
                 f"{x['day']}-{x['block']}" 
                 for x in st.session_state.unavailable_constraints 
-                if x['name'] == row['name']
+                if x['name'] == row.name
             ]
             
             employees.append(Employee(
-                id=str(uuid.uuid4()), 
-                name=row['name'],
-                role=row['role'],
-                max_hours=int(row['max_hours']),
+                id=f"e{i}",  # stable across reruns so the solve cache can hit
+                name=row.name,
+                role=row.role,
+                max_hours=int(row.max_hours),
                 unavailable_slots=my_blocks
             ))
             
         requests = []
-        for _, row in st.session_state.demand_data.iterrows():
-            d = Day(row['Day'])
-            requests.append(ShiftRequest(day=d, block=TimeBlock.MORNING, required_staff=int(row['Morning'])))
-            requests.append(ShiftRequest(day=d, block=TimeBlock.LUNCH, required_staff=int(row['Lunch'])))
-            requests.append(ShiftRequest(day=d, block=TimeBlock.DINNER, required_staff=int(row['Dinner'])))
+        for row in st.session_state.demand_data.itertuples(index=False):
+            d = Day(row.Day)
+            requests.append(ShiftRequest(day=d, block=TimeBlock.MORNING, required_staff=int(row.Morning)))
+            requests.append(ShiftRequest(day=d, block=TimeBlock.LUNCH, required_staff=int(row.Lunch)))
+            requests.append(ShiftRequest(day=d, block=TimeBlock.DINNER, required_staff=int(row.Dinner)))
 
         role_constraints = []
         if 'role_rules' in st.session_state and not st.session_state.role_rules.empty:
-            for _, row in st.session_state.role_rules.iterrows():
-                r_role = row.get('role')
-                r_count = row.get('min_count')
+            for row in st.session_state.role_rules.itertuples(index=False):
+                r_role = getattr(row, 'role', None)
+                r_count = getattr(row, 'min_count', None)
                 if r_role and pd.notna(r_count) and r_count > 0:
                     role_constraints.append(RoleConstraint(
                         role=str(r_role), 
                         min_count=int(r_count)
                     ))
         
-        st.session_state.result = solve_schedule(employees, requests, role_constraints)
+        st.session_state.result = ScheduleOutput.model_validate(
+            _solve_cached(
+                _to_json(employees), _to_json(requests), _to_json(role_constraints),
+                _hint=_warm_start_hint(st.session_state.get('result'))
+            )
+        )
 
 # STEP 4: RESULTS
-if 'result' in st.session_state:
-    res = st.session_state.result
+# Fragment: result-grid edits rerun only this block instead of the whole app
+@st.fragment
+def render_results(res):
     st.divider()
     
     # --- METRICS ---
@@ -236,10 +314,8 @@ if 'result' in st.session_state:
     
     if not df_res.empty:
         # Sort Chronologically
-        day_map = {d.value: i for i, d in enumerate(Day)}
-        block_map = {"Morning": 0, "Lunch": 1, "Dinner": 2}
-        df_res['day_rank'] = df_res['day'].map(day_map)
-        df_res['block_rank'] = df_res['block'].map(block_map)
+        df_res['day_rank'] = df_res['day'].map(DAY_INDEX)
+        df_res['block_rank'] = df_res['block'].map(BLOCK_INDEX)
         df_res = df_res.sort_values(['day_rank', 'block_rank']).drop(columns=['day_rank', 'block_rank'])
 
         # Editable Grid
@@ -255,7 +331,7 @@ if 'result' in st.session_state:
         )
         
         # --- NEW: CSV DOWNLOAD ---
-        csv = edited_df.to_csv(index=False).encode('utf-8')
+        csv = _schedule_csv(_df_key(edited_df))
         st.download_button(
             label="📄 Download Schedule (CSV)",
             data=csv,
@@ -286,8 +362,10 @@ if 'result' in st.session_state:
                 "staff_str": row['staff_str']
             })
             
-        from solver import generate_whatsapp_export
         final_text = generate_whatsapp_export(updated_assignments)
         st.text_area("Copy this text:", value=final_text, height=300)
     else:
-        st.warning("No shifts assigned.")
\ No newline at end of file
+        st.warning("No shifts assigned.")
+
+if 'result' in st.session_state:
+    render_results(st.session_state.result)
@@ -16,6 +16,12 @@ class Day(str, Enum):
     SAT = "Sat"
     SUN = "Sun"
 
+# Built once at import; app.py reruns every interaction but imported modules don't
+DAY_VALUES = tuple(d.value for d in Day)
+BLOCK_VALUES = tuple(b.value for b in TimeBlock)
+DAY_INDEX = {d: i for i, d in enumerate(DAY_VALUES)}
+BLOCK_INDEX = {b: i for i, b in enumerate(BLOCK_VALUES)}
+
 class Employee(BaseModel):
     id: str  # e.g., "john_doe"
     name: str
@@ -34,6 +40,7 @@ class ScheduleOutput(BaseModel):
     assignments: List[dict] # {day, block, employee_name}
     metrics: Dict[str, float]
     formatted_text: str
+    is_optimal: bool = False  # False for time-limited FEASIBLE results and failures
 
 # Add this class to models.py
 class RoleConstraint(BaseModel):
@@ -1,10 +1,26 @@
 from ortools.sat.python import cp_model
-from models import Employee, ShiftRequest, TimeBlock, Day, ScheduleOutput
+from models import Employee, ShiftRequest, ScheduleOutput, DAY_VALUES, BLOCK_VALUES, DAY_INDEX, BLOCK_INDEX
 import pandas as pd
 import numpy as np
+import os
+from typing import Optional
+from functools import lru_cache
+
+# CPUs this process may use (respects container/cgroup affinity, unlike os.cpu_count());
+# capped where CP-SAT portfolio search stops scaling. Computed once per process.
+MAX_WORKERS = 8
+
+@lru_cache(maxsize=None)
+def _worker_count() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    return max(1, min(cpus, MAX_WORKERS))
 
 # UPDATE: Added role_constraints parameter (default empty list)
-def solve_schedule(employees: list[Employee], demands: list[ShiftRequest], role_constraints: list = []) -> ScheduleOutput:
+# hint: optional set of (emp_id, day, block) worked in a previous schedule, used as a warm start
+def solve_schedule(employees: list[Employee], demands: list[ShiftRequest], role_constraints: list = [], hint: Optional[set] = None) -> ScheduleOutput:
     model = cp_model.CpModel()
     
     # 1. Weights
@@ -14,34 +30,59 @@ def solve_schedule(employees: list[Employee], demands: list[ShiftRequest], role_
     WEIGHT_OVERTIME = 50
     
     BLOCK_HOURS = 4
-    days_list = [d.value for d in Day]
-    blocks_list = [b.value for b in TimeBlock]
+    days_list = DAY_VALUES
+    blocks_list = BLOCK_VALUES
     
     # 2. Variables
-    shifts = {}
-    for emp in employees:
-        for d in days_list:
-            for b in blocks_list:
-                shifts[(emp.id, d, b)] = model.NewBoolVar(f'shift_{emp.id}_{d}_{b}')
+    # Vars are left unnamed: CP-SAT doesn't need names and the f-strings dominated build time
+    # shifts[i, j, k] = employee i works day j, block k (int indexing, no tuple-key hashing)
+    shifts = np.empty((len(employees), len(days_list), len(blocks_list)), dtype=object)
+    for idx in np.ndindex(shifts.shape):
+        shifts[idx] = model.NewBoolVar("")
+
+    # Warm start: seed search with the last schedule so small edits re-solve from a good incumbent
+    if hint:
+        for (i, j, k), var in np.ndenumerate(shifts):
+            model.AddHint(var, int((employees[i].id, days_list[j], blocks_list[k]) in hint))
 
     # 3. Hard Constraints (Availability)
-    for emp in employees:
-        for d in days_list:
-            for b in blocks_list:
-                slot_key = f"{d}-{b}"
-                if slot_key in emp.unavailable_slots:
-                    model.Add(shifts[(emp.id, d, b)] == 0)
+    # Set lookups + slot keys built once instead of a list scan per (emp, day, block)
+    slot_keys = {(j, k): f"{d}-{b}" for j, d in enumerate(days_list) for k, b in enumerate(blocks_list)}
+    blocked = [set(emp.unavailable_slots) for emp in employees]
+    for i, emp_blocked in enumerate(blocked):
+        if not emp_blocked:
+            continue
+        for (j, k), slot_key in slot_keys.items():
+            if slot_key in emp_blocked:
+                model.Add(shifts[i, j, k] == 0)
 
     # 4. Soft Constraints
+    # Parallel var/weight lists so the objective is one WeightedSum; constants go to the offset
     penalty_vars = []
+    penalty_weights = []
+    penalty_offset = 0
+
+    # Who can actually work each slot; used to tighten the slack variable bounds below
+    available = {
+        key: [i for i in range(len(employees)) if slot_key not in blocked[i]]
+        for key, slot_key in slot_keys.items()
+    }
 
     # A. Coverage
     for req in demands:
-        d, b, needed = req.day.value, req.block.value, req.required_staff
-        working_staff = sum(shifts[(e.id, d, b)] for e in employees)
-        shortage = model.NewIntVar(0, needed, f'shortage_{d}_{b}')
+        j, k, needed = DAY_INDEX[req.day.value], BLOCK_INDEX[req.block.value], req.required_staff
+        if needed <= 0:
+            continue
+        avail_emps = available[(j, k)]
+        if not avail_emps:
+            # Nobody can work this slot: the shortage is a constant
+            penalty_offset += needed * WEIGHT_UNASSIGNED
+            continue
+        working_staff = cp_model.LinearExpr.Sum(shifts[avail_emps, j, k].tolist())
+        shortage = model.NewIntVar(max(0, needed - len(avail_emps)), needed, "")
         model.Add(working_staff + shortage >= needed)
-        penalty_vars.append(shortage * WEIGHT_UNASSIGNED)
+        penalty_vars.append(shortage)
+        penalty_weights.append(WEIGHT_UNASSIGNED)
 
     # B. NEW: Role Requirements Logic
     for rc in role_constraints:
@@ -49,77 +90,87 @@ def solve_schedule(employees: list[Employee], demands: list[ShiftRequest], role_
         min_needed = rc.min_count
         
         # Identify employees who have this role
-        eligible_emps = [e for e in employees if e.role == target_role]
+        eligible_emps = {i for i, e in enumerate(employees) if e.role == target_role}
         
-        if eligible_emps:
-            for d in days_list:
-                for b in blocks_list:
-                    # Sum of working staff with this role
-                    role_force = sum(shifts[(e.id, d, b)] for e in eligible_emps)
-                    
-                    role_shortage = model.NewIntVar(0, min_needed, f'role_short_{target_role}_{d}_{b}')
-                    model.Add(role_force + role_shortage >= min_needed)
-                    penalty_vars.append(role_shortage * WEIGHT_ROLE_MISSING)
+        if eligible_emps and min_needed > 0:
+            for (j, k), avail_emps in available.items():
+                # Sum of working staff with this role
+                role_avail = [i for i in avail_emps if i in eligible_emps]
+                if not role_avail:
+                    penalty_offset += min_needed * WEIGHT_ROLE_MISSING
+                    continue
+                role_force = cp_model.LinearExpr.Sum(shifts[role_avail, j, k].tolist())
+                
+                role_shortage = model.NewIntVar(max(0, min_needed - len(role_avail)), min_needed, "")
+                model.Add(role_force + role_shortage >= min_needed)
+                penalty_vars.append(role_shortage)
+                penalty_weights.append(WEIGHT_ROLE_MISSING)
 
     # C. Prevent Clopens
-    for emp in employees:
-        for i in range(len(days_list) - 1):
-            today = days_list[i]
-            tomorrow = days_list[i+1]
-            dinner_var = shifts[(emp.id, today, "Dinner")]
-            morning_var = shifts[(emp.id, tomorrow, "Morning")]
+    dinner, morning = BLOCK_INDEX["Dinner"], BLOCK_INDEX["Morning"]
+    for i in range(len(employees)):
+        for j in range(len(days_list) - 1):
+            dinner_var = shifts[i, j, dinner]
+            morning_var = shifts[i, j + 1, morning]
             
-            is_clopen = model.NewBoolVar(f'clopen_{emp.id}_{today}')
-            model.AddBoolAnd([dinner_var, morning_var]).OnlyEnforceIf(is_clopen)
-            model.AddBoolOr([dinner_var.Not(), morning_var.Not()]).OnlyEnforceIf(is_clopen.Not())
-            penalty_vars.append(is_clopen * WEIGHT_CLOPEN)
+            # is_clopen is only penalized, so the minimizer keeps it 0 unless both shifts are on
+            is_clopen = model.NewBoolVar("")
+            model.Add(dinner_var + morning_var <= 1 + is_clopen)
+            penalty_vars.append(is_clopen)
+            penalty_weights.append(WEIGHT_CLOPEN)
 
     # D. Max Hours
-    for emp in employees:
-        total_blocks = sum(shifts[(emp.id, d, b)] for d in days_list for b in blocks_list)
+    for i, emp in enumerate(employees):
+        # Overtime can't exceed the hours of every slot they're available for
+        open_slots = sum(1 for slot_key in slot_keys.values() if slot_key not in blocked[i])
+        max_overtime = open_slots * BLOCK_HOURS - emp.max_hours
+        if max_overtime <= 0:
+            continue
+        total_blocks = cp_model.LinearExpr.Sum(shifts[i].ravel().tolist())
         total_hours = total_blocks * BLOCK_HOURS
-        overtime = model.NewIntVar(0, 100, f'over_{emp.id}')
-        model.Add(total_hours <= emp.max_hours + overtime)
-        penalty_vars.append(overtime * WEIGHT_OVERTIME)
+        overtime = model.NewIntVar(0, max_overtime, "")
+        model.AddMaxEquality(overtime, [total_hours - emp.max_hours, 0])
+        penalty_vars.append(overtime)
+        penalty_weights.append(WEIGHT_OVERTIME)
 
     # 5. Solve
-    model.Minimize(sum(penalty_vars))
+    model.Minimize(cp_model.LinearExpr.WeightedSum(penalty_vars, penalty_weights) + penalty_offset)
+    # Fresh solver per call: CP-SAT keeps no threads/state between Solve calls, so there's
+    # nothing to share. Fields are set directly (parameters isn't a protobuf on newer OR-Tools).
     solver = cp_model.CpSolver()
+    # Parallel portfolio search; time limit bounds the worst case
+    solver.parameters.num_workers = _worker_count()
+    solver.parameters.max_time_in_seconds = 15.0
+    solver.parameters.linearization_level = 2
+    solver.parameters.cp_model_presolve = True
     status = solver.Solve(model)
 
     # 6. Parse Results
     assignments = []
-    emp_hours_solved = {}
 
     if status in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
-        # Calculate hours ONLY after solve
-        for emp in employees:
-            total_blocks = sum(solver.Value(shifts[(emp.id, d, b)]) for d in days_list for b in blocks_list)
-            emp_hours_solved[emp.id] = total_blocks * BLOCK_HOURS
-
-        for d in days_list:
-            for b in blocks_list:
-                assigned_names = []
-                for emp in employees:
-                    if solver.Value(shifts[(emp.id, d, b)]) == 1:
-                        assigned_names.append(emp.name)
-                
-                # Format names with role hints
-                staff_display = []
-                for name in assigned_names:
-                    role = next((e.role for e in employees if e.name == name), "")
-                    short_role = f" ({role[:3]})" if role else ""
-                    staff_display.append(f"{name}{short_role}")
+        # Read every shift value once; hours + assignments come from the int array
+        solved = np.array([solver.Value(v) for v in shifts.flat], dtype=int).reshape(shifts.shape)
+        hours_values = (solved.sum(axis=(1, 2)) * BLOCK_HOURS).tolist()
 
+        # Role hints per employee, built once (also correct when two staff share a name)
+        display_name = [f"{e.name} ({e.role[:3]})" if e.role else e.name for e in employees]
+        for j, d in enumerate(days_list):
+            for k, b in enumerate(blocks_list):
+                on = np.flatnonzero(solved[:, j, k])
                 assignments.append({
                     "day": d, 
                     "block": b, 
-                    "staff": assigned_names,
-                    "staff_str": ", ".join(staff_display)
+                    "staff": [employees[i].name for i in on],
+                    "staff_ids": [employees[i].id for i in on],
+                    "staff_str": ", ".join(display_name[i] for i in on)
                 })
         
-        hours_values = list(emp_hours_solved.values())
-        fairness_score = float(np.std(hours_values)) if hours_values else 0.0
+        # Population std dev inline: cheaper than np.std for a handful of values
+        fairness_score = 0.0
+        if hours_values:
+            m = sum(hours_values) / len(hours_values)
+            fairness_score = (sum((h - m) ** 2 for h in hours_values) / len(hours_values)) ** 0.5
         
         return ScheduleOutput(
             assignments=assignments,
@@ -127,24 +178,23 @@ def solve_schedule(employees: list[Employee], demands: list[ShiftRequest], role_
                 "fairness_std_dev": fairness_score,
                 "total_penalty": solver.ObjectiveValue()
             },
-            formatted_text=generate_whatsapp_export(assignments)
+            formatted_text=generate_whatsapp_export(assignments),
+            is_optimal=status == cp_model.OPTIMAL
         )
     else:
         return ScheduleOutput(assignments=[], metrics={"total_penalty": 0.0, "fairness_std_dev": 0.0}, formatted_text="Unsolvable Error")
 
+_ICON = {"Morning": "☀️", "Lunch": "🍔", "Dinner": "🌙"}
+
 def generate_whatsapp_export(assignments):
     df = pd.DataFrame(assignments)
     if df.empty: return "No schedule generated."
     
-    text = "*🍽️ Weekly Roster Draft*\n\n"
-    for day in df['day'].unique():
-        text += f"📅 *{day}*\n"
-        day_data = df[df['day'] == day]
-        for _, row in day_data.iterrows():
-            icon = "☀️" if row['block'] == "Morning" else "🍔" if row['block'] == "Lunch" else "🌙"
-            text += f"{icon} {row['block']}: {row['staff_str']}\n"
-        text += "\n"
-    return text
-        
-    text += "_Generated by ShiftHero AI_"
-    return text
\ No newline at end of file
+    # One groupby pass (keeps first-seen day order) instead of a mask scan per day
+    parts = ["*🍽️ Weekly Roster Draft*\n\n"]
+    for day, day_data in df.groupby('day', sort=False):
+        parts.append(f"📅 *{day}*\n")
+        for row in day_data.itertuples(index=False):
+            parts.append(f"{_ICON.get(row.block, '🌙')} {row.block}: {row.staff_str}\n")
+        parts.append("\n")
+    return "".join(parts)